@@ -2,10 +2,12 @@ from .logger import logger
 from .env_settings import envs
 from .exceptions import setup_exception_handlers
 from .redis_client import redis_log_client
+from .tracing import setup_tracing
 
 __all__ = [
     "logger",
     "envs",
     "setup_exception_handlers",
     "redis_log_client",
+    "setup_tracing",
 ]
@@ -38,6 +38,28 @@ class EnvSettings:
     # Image Layered
     OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs")
     ENABLE_ML_MODEL = os.getenv("ENABLE_ML_MODEL", "true").lower() == "true"
+    FILE_INDEX_MAX_SIZE = int(os.getenv("FILE_INDEX_MAX_SIZE", "1024"))
+
+    # Model Warm-up / Compile
+    ENABLE_MODEL_WARMUP = (
+        os.getenv("ENABLE_MODEL_WARMUP", "true").lower() == "true"
+    )
+    MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "2"))
+    ENABLE_TORCH_COMPILE = (
+        os.getenv("ENABLE_TORCH_COMPILE", "false").lower() == "true"
+    )
+    COMPILE_CACHE_DIR = os.getenv("COMPILE_CACHE_DIR", "cache/compile")
+
+    # Tracing
+    ENABLE_TRACING = os.getenv("ENABLE_TRACING", "false").lower() == "true"
+    TRACE_SERVER_TIMING = (
+        os.getenv("TRACE_SERVER_TIMING", "true").lower() == "true"
+    )
+    TRACE_SERVICE_NAME = os.getenv(
+        "TRACE_SERVICE_NAME", "qwen-image-layered-api"
+    )
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+    TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL")
 
 
 envs = EnvSettings()
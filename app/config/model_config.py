@@ -15,6 +15,20 @@ DEFAULT_NUM_INFERENCE_STEPS = 50  # Lightning LoRA 사용 시 8로 변경
 DEFAULT_TRUE_CFG_SCALE = 4.0
 DEFAULT_SEED = 42
 
+# 레이어 후처리 설정
+TRIM_ALPHA_THRESHOLD = 0  # 이 값보다 큰 알파만 레이어 내용으로 간주
+PREVIEW_MAX_SIZE = 256  # 합성 미리보기 긴 변 최대 길이
+
+# 워밍업 설정 (커널 선택/메모리 할당/지연 초기화를 첫 요청 전에 수행)
+# 레이어 수/해상도는 실제 기본 요청과 같아야 컴파일 그래프와 메모리 할당이 재사용됨
+WARMUP_LAYERS = DEFAULT_LAYERS
+WARMUP_RESOLUTION = DEFAULT_RESOLUTION
+WARMUP_NUM_INFERENCE_STEPS = 2  # 스텝 수만 줄여 워밍업 시간 단축
+
+# torch.compile 설정 (ENABLE_TORCH_COMPILE=true 일 때만 사용)
+TORCH_COMPILE_MODE = "default"
+COMPILE_ARTIFACT_FILENAME = "compile_artifacts.bin"
+
 
 def get_device():
     """사용 가능한 디바이스 자동 감지"""
@@ -0,0 +1,277 @@
+"""요청 단위 트레이싱 (OpenTelemetry 호환 JSON 내보내기)"""
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import threading
+import requests
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .env_settings import envs
+from .logger import logger
+
+REQUEST_ID_HEADER = "X-Request-ID"
+EXPORT_QUEUE_SIZE = 1000
+
+# 현재 요청의 트레이스와 부모 스팬 (트레이싱 비활성화 시 항상 None)
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar(
+    "current_trace", default=None
+)
+_current_span_id: ContextVar[Optional[str]] = ContextVar(
+    "current_span_id", default=None
+)
+
+
+class Trace:
+    """하나의 요청에서 수집된 스팬 모음"""
+
+    def __init__(self, request_id: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.spans: List[Dict[str, Any]] = []
+
+    def add_span(
+        self,
+        name: str,
+        span_id: str,
+        parent_id: Optional[str],
+        start_ns: int,
+        end_ns: int,
+        attributes: Dict[str, Any],
+    ):
+        self.spans.append({
+            "name": name,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "start_ns": start_ns,
+            "end_ns": end_ns,
+            "attributes": attributes,
+        })
+
+
+def _new_span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    """현재 요청 ID 반환 (트레이싱 비활성화 시 None)"""
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def request_log_prefix() -> str:
+    """로그 상관관계용 요청 ID 접두사 (트레이싱 비활성화 시 빈 문자열)"""
+    request_id = get_request_id()
+    return f"[{request_id}] " if request_id else ""
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    현재 요청 트레이스에 중첩 스팬 기록
+
+    활성 트레이스가 없으면 아무것도 기록하지 않습니다.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    span_id = _new_span_id()
+    parent_id = _current_span_id.get()
+    token = _current_span_id.set(span_id)
+    start_ns = time.time_ns()
+    try:
+        yield
+    except Exception as e:
+        attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span_id.reset(token)
+        trace.add_span(
+            name, span_id, parent_id, start_ns, time.time_ns(), attributes
+        )
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes):
+    """이미 측정된 구간을 현재 스팬의 자식 스팬으로 기록"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.add_span(
+        name,
+        _new_span_id(),
+        _current_span_id.get(),
+        start_ns,
+        end_ns,
+        attributes,
+    )
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(trace: Trace) -> Dict[str, Any]:
+    """트레이스를 OTLP/HTTP JSON(ExportTraceServiceRequest) 형식으로 변환"""
+    spans = []
+    for item in trace.spans:
+        attributes = {"request.id": trace.request_id, **item["attributes"]}
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": item["span_id"],
+            "parentSpanId": item["parent_id"] or "",
+            "name": item["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(item["start_ns"]),
+            "endTimeUnixNano": str(item["end_ns"]),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in attributes.items()
+            ],
+        })
+
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{
+                    "key": "service.name",
+                    "value": {"stringValue": envs.TRACE_SERVICE_NAME},
+                }]
+            },
+            "scopeSpans": [{
+                "scope": {"name": "app.config.tracing"},
+                "spans": spans,
+            }],
+        }]
+    }
+
+
+def server_timing(trace: Trace) -> str:
+    """스팬 이름별 누적 시간(ms)을 Server-Timing 헤더 값으로 요약"""
+    durations: Dict[str, float] = {}
+    for item in trace.spans:
+        metric = re.sub(r"[^A-Za-z0-9_\-]", "_", item["name"])
+        elapsed_ms = (item["end_ns"] - item["start_ns"]) / 1_000_000
+        durations[metric] = durations.get(metric, 0.0) + elapsed_ms
+    return ", ".join(
+        f"{metric};dur={elapsed_ms:.1f}"
+        for metric, elapsed_ms in durations.items()
+    )
+
+
+# 내보내기는 단일 백그라운드 스레드에서 처리해 이벤트 루프를 막지 않음
+_export_queue: "queue.Queue[Trace]" = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+
+
+def _write_trace(trace: Trace):
+    payload = to_otlp_json(trace)
+
+    if envs.TRACE_EXPORT_PATH:
+        try:
+            export_dir = os.path.dirname(envs.TRACE_EXPORT_PATH)
+            if export_dir:
+                os.makedirs(export_dir, exist_ok=True)
+            with open(envs.TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload) + "\n")
+        except Exception as e:
+            logger.warning(f"Trace export to file failed: {e}")
+
+    if envs.TRACE_COLLECTOR_URL:
+        try:
+            response = requests.post(
+                envs.TRACE_COLLECTOR_URL, json=payload, timeout=5
+            )
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Trace export to collector failed: {e}")
+
+
+def _export_worker():
+    while True:
+        _write_trace(_export_queue.get())
+
+
+def export_trace(trace: Trace):
+    """설정된 대상(JSON Lines 파일, OTLP/HTTP 수집기)으로 내보내도록 큐에 등록"""
+    if not trace.spans:
+        return
+    if not (envs.TRACE_EXPORT_PATH or envs.TRACE_COLLECTOR_URL):
+        return
+
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        logger.warning("Trace export queue is full, dropping trace")
+
+
+class TracingMiddleware:
+    """
+    요청마다 트레이스를 시작하는 ASGI 미들웨어
+
+    receive는 그대로 전달하므로 엔드포인트의 request.is_disconnected()가
+    클라이언트 연결 종료를 감지할 수 있습니다.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = (
+            Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        )
+        method, path = scope["method"], scope["path"]
+        trace = Trace(request_id)
+        trace_token = _current_trace.set(trace)
+        start_ns = time.time_ns()
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(REQUEST_ID_HEADER, request_id)
+                if envs.TRACE_SERVER_TIMING:
+                    elapsed_ms = (time.time_ns() - start_ns) / 1_000_000
+                    summary = server_timing(trace)
+                    total = f"total;dur={elapsed_ms:.1f}"
+                    headers.append(
+                        "Server-Timing",
+                        f"{summary}, {total}" if summary else total,
+                    )
+            await send(message)
+
+        try:
+            with span(
+                f"{method} {path}",
+                **{"http.method": method, "http.target": path},
+            ):
+                await self.app(scope, receive, send_with_headers)
+        finally:
+            _current_trace.reset(trace_token)
+            export_trace(trace)
+
+
+def setup_tracing(app: FastAPI):
+    """ENABLE_TRACING=true 인 경우 요청마다 트레이스를 시작하는 미들웨어 등록"""
+    if not envs.ENABLE_TRACING:
+        return
+
+    if envs.TRACE_EXPORT_PATH or envs.TRACE_COLLECTOR_URL:
+        threading.Thread(target=_export_worker, daemon=True).start()
+
+    app.add_middleware(TracingMiddleware)
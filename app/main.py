@@ -1,7 +1,7 @@
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.config import envs, logger, setup_exception_handlers
+from app.config import envs, logger, setup_exception_handlers, setup_tracing
 from app.routers import api_router
 from app.services import image_layered_service
 
@@ -22,6 +22,14 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"❌ Failed to load model on startup: {e}")
             logger.warning("App will start but image layered features may not work")
+
+        if envs.ENABLE_MODEL_WARMUP and image_layered_service.pipeline is not None:
+            try:
+                logger.info("Warming up ML model...")
+                await image_layered_service.warmup()
+            except Exception as e:
+                logger.error(f"❌ Model warm-up failed: {e}")
+                logger.warning("First request may be slow")
     else:
         logger.info("ML model loading is disabled (ENABLE_ML_MODEL=false)")
 
@@ -38,6 +46,7 @@ def create_app():
     main_application.include_router(api_router)
 
     setup_exception_handlers(main_application)
+    setup_tracing(main_application)
 
     @main_application.get("/")
     async def root():
@@ -1,21 +1,109 @@
-from fastapi import APIRouter, UploadFile, File, Query
-from fastapi.responses import FileResponse
+import os
+import asyncio
+from typing import Optional
+from fastapi import (
+    APIRouter,
+    UploadFile,
+    File,
+    Query,
+    Header,
+    Request,
+    HTTPException,
+)
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.types import Message, Receive, Scope, Send
 from PIL import Image
 import io
 from app.services.image_layered_service import image_layered_service
+from app.services.cancellation import (
+    CancelToken,
+    InferenceCancelled,
+    InferenceTimeout,
+)
 from app.config import logger
+from app.config.tracing import span, request_log_prefix
 
 router = APIRouter()
 
+# 결과 파일은 작성 후 변경되지 않으므로 장기 캐시 허용
+FILE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 헤더가 ETag와 일치하는지 확인 (약한 비교)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class IndexedFileResponse(FileResponse):
+    """
+    인덱스된 stat 정보로 응답하는 FileResponse
+
+    인덱싱 이후 파일이 삭제된 경우 FileResponse가 파일을 여는 시점에
+    실패하므로, 응답 시작 메시지를 첫 본문 전송까지 미뤘다가 404로 대체합니다.
+    (파일은 FileResponse가 한 번만 엶)
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        pending_start: Optional[Message] = None
+
+        async def deferred_send(message: Message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                pending_start = message
+                return
+            if pending_start is not None:
+                await send(pending_start)
+                pending_start = None
+            await send(message)
+
+        try:
+            await super().__call__(scope, receive, deferred_send)
+        except FileNotFoundError:
+            # 이미 본문 전송을 시작한 경우에는 응답을 바꿀 수 없음
+            if pending_start is None:
+                raise
+            filename = os.path.basename(self.path)
+            image_layered_service.forget_file(filename)
+            logger.error(
+                f"{request_log_prefix()}Indexed file was removed: {filename}"
+            )
+            response = JSONResponse(
+                status_code=404,
+                content={"error": f"File not found: {filename}"},
+            )
+            await response(scope, receive, send)
+
+
+async def _watch_disconnect(
+    request: Request, cancel_token: CancelToken, interval: float = 0.5
+):
+    """클라이언트 연결 종료를 감지하면 추론 취소"""
+    while not cancel_token.cancelled:
+        if await request.is_disconnected():
+            cancel_token.cancel("client disconnected")
+            return
+        await asyncio.sleep(interval)
+
 
 @router.post("/decompose")
 async def decompose_image(
+    request: Request,
     file: UploadFile = File(..., description="업로드할 이미지 파일"),
     layers: int = Query(default=4, ge=2, le=10, description="생성할 레이어 수"),
     resolution: int = Query(default=640, ge=256, le=2048, description="출력 해상도"),
     num_inference_steps: int = Query(default=50, ge=1, le=100, description="추론 스텝 수"),
     true_cfg_scale: float = Query(default=4.0, ge=1.0, le=10.0, description="CFG 스케일"),
-    seed: int = Query(default=42, description="랜덤 시드")
+    seed: int = Query(default=42, description="랜덤 시드"),
+    trim: bool = Query(default=False, description="투명 영역 크롭 및 빈 레이어 제거"),
+    timeout: Optional[float] = Query(default=None, gt=0, description="제한 시간(초)"),
+    request_timeout: Optional[float] = Header(
+        default=None, gt=0, alias="X-Request-Timeout", description="제한 시간(초)"
+    )
 ):
     """
     이미지를 여러 레이어로 분해합니다.
@@ -26,63 +114,97 @@ async def decompose_image(
     - **num_inference_steps**: 추론 스텝 수 (Lightning LoRA 사용 시 8 권장)
     - **true_cfg_scale**: CFG 스케일 값
     - **seed**: 재현성을 위한 랜덤 시드
+    - **trim**: 레이어를 불투명 영역으로 크롭(오프셋은 layer_meta), 빈 레이어 제거, 합성 미리보기 생성
+    - **timeout**: 제한 시간(초), `X-Request-Timeout` 헤더로도 지정 가능.
+      초과하거나 클라이언트 연결이 끊기면 다음 스텝에서 추론을 중단하고 결과를 저장하지 않음
     """
+    cancel_token = CancelToken.from_timeout(timeout or request_timeout)
+    watcher = asyncio.create_task(_watch_disconnect(request, cancel_token))
+
     try:
         # 이미지 읽기
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes))
+        with span("file.read"):
+            image_bytes = await file.read()
+        with span("image.open", bytes=len(image_bytes)):
+            image = Image.open(io.BytesIO(image_bytes))
 
-        logger.info(f"Processing image: {file.filename}, layers: {layers}")
+        logger.info(f"{request_log_prefix()}Processing image: {file.filename}, layers: {layers}")
 
         # 이미지 분해
-        result_id, layer_paths, count = await image_layered_service.decompose_image(
-            image=image,
-            layers=layers,
-            resolution=resolution,
-            num_inference_steps=num_inference_steps,
-            true_cfg_scale=true_cfg_scale,
-            seed=seed
-        )
+        with span("decompose_image"):
+            result = await image_layered_service.decompose_image(
+                image=image,
+                layers=layers,
+                resolution=resolution,
+                num_inference_steps=num_inference_steps,
+                true_cfg_scale=true_cfg_scale,
+                seed=seed,
+                trim=trim,
+                cancel_token=cancel_token
+            )
 
         return {
             "success": True,
-            "id": result_id,
-            "layers": layer_paths,
-            "count": count,
-            "message": f"Successfully decomposed into {count} layers"
+            **result,
+            "message": f"Successfully decomposed into {result['count']} layers"
         }
 
+    except InferenceTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except InferenceCancelled as e:
+        # 클라이언트가 이미 연결을 끊었으므로 응답은 전달되지 않음
+        raise HTTPException(status_code=499, detail=str(e))
     except Exception as e:
-        logger.error(f"Decompose error: {e}")
+        logger.error(f"{request_log_prefix()}Decompose error: {e}")
         return {
             "success": False,
             "error": str(e)
         }
+    finally:
+        watcher.cancel()
+
 
+@router.get("/status")
+async def get_status():
+    """
+    모델 준비 상태와 워밍업/첫 요청 지연 시간(초)을 반환합니다.
+    """
+    return {
+        "ready": image_layered_service.is_ready(),
+        "model_loaded": image_layered_service.pipeline is not None,
+        "compiled": image_layered_service.compiled,
+        "metrics": image_layered_service.metrics,
+    }
 
-@router.get("/files/{filename}")
-async def get_layer_file(filename: str):
+
+@router.api_route("/files/{filename}", methods=["GET", "HEAD"])
+async def get_layer_file(filename: str, request: Request):
     """
     생성된 레이어 이미지 파일을 다운로드합니다.
 
     - **filename**: 레이어 파일명 (예: abc12345_layer0.png)
+
+    ETag/If-None-Match(304), Range 요청, HEAD 요청을 지원합니다.
     """
     try:
-        file_path = image_layered_service.get_file_path(filename)
-        return FileResponse(
-            file_path,
-            media_type="image/png",
-            filename=filename
-        )
+        file_info = await image_layered_service.get_file_info(filename)
     except FileNotFoundError as e:
-        logger.error(f"File not found: {filename}")
-        return {
-            "success": False,
-            "error": str(e)
-        }
-    except Exception as e:
-        logger.error(f"Error serving file: {e}")
-        return {
-            "success": False,
-            "error": str(e)
-        }
+        logger.error(f"{request_log_prefix()}File not found: {filename}")
+        raise HTTPException(status_code=404, detail=str(e))
+
+    headers = {
+        "ETag": file_info["etag"],
+        "Cache-Control": FILE_CACHE_CONTROL,
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), file_info["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    # stat_result를 넘겨 요청마다 파일 시스템 stat 호출 생략
+    return IndexedFileResponse(
+        file_info["path"],
+        media_type="image/png",
+        filename=filename,
+        headers=headers,
+        stat_result=file_info["stat"],
+    )
@@ -0,0 +1,73 @@
+"""추론 취소 및 제한 시간(deadline) 전파"""
+import time
+import asyncio
+import threading
+from typing import List, Optional, Tuple
+
+
+class InferenceCancelled(Exception):
+    """클라이언트 연결 종료 등으로 추론이 취소됨"""
+
+
+class InferenceTimeout(InferenceCancelled):
+    """요청 제한 시간 초과로 추론이 중단됨"""
+
+
+class CancelToken:
+    """
+    요청 단위 취소 토큰
+
+    이벤트 루프(연결 감시)에서 cancel()을 호출하고, 추론 스레드에서는
+    스텝 경계마다 check()로 취소/제한 시간 초과 여부를 확인합니다.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        # time.monotonic() 기준 종료 시각
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        # wait_cancelled() 대기자 (이벤트 루프, 이벤트)
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    @classmethod
+    def from_timeout(cls, timeout: Optional[float]) -> "CancelToken":
+        """제한 시간(초)으로 토큰 생성 (None이면 제한 없음)"""
+        if timeout is None:
+            return cls()
+        return cls(deadline=time.monotonic() + timeout)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+            # 다른 스레드에서 호출될 수 있으므로 각 루프에서 이벤트 설정
+            for loop, event in list(self._waiters):
+                loop.call_soon_threadsafe(event.set)
+
+    async def wait_cancelled(self):
+        """취소되거나 제한 시간이 지날 때까지 대기"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        self._waiters.append(waiter)
+        try:
+            if self._cancelled.is_set():
+                return
+            timeout = None
+            if self.deadline is not None:
+                timeout = max(0.0, self.deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self._waiters.remove(waiter)
+
+    def check(self):
+        """취소되었거나 제한 시간이 지났으면 예외 발생"""
+        if self._cancelled.is_set():
+            raise InferenceCancelled(f"Inference cancelled: {self.reason}")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise InferenceTimeout("Inference deadline exceeded")
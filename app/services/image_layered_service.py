@@ -1,15 +1,36 @@
+import io
 import os
+import asyncio
 import uuid
+import time
+import hashlib
 import torch
+from collections import OrderedDict
 from PIL import Image
-from typing import List, Tuple
+from typing import Any, Dict, Optional
 from app.config import logger, envs
+from app.config.tracing import span, record_span, request_log_prefix
 from app.config.model_config import (
     QWEN_MODEL_NAME,
     DEVICE,
     TORCH_DTYPE,
     USE_LIGHTNING_LORA,
-    LIGHTNING_LORA_PATH
+    LIGHTNING_LORA_PATH,
+    TRIM_ALPHA_THRESHOLD,
+    PREVIEW_MAX_SIZE,
+    DEFAULT_TRUE_CFG_SCALE,
+    DEFAULT_SEED,
+    WARMUP_LAYERS,
+    WARMUP_RESOLUTION,
+    WARMUP_NUM_INFERENCE_STEPS,
+    TORCH_COMPILE_MODE,
+    COMPILE_ARTIFACT_FILENAME
+)
+from app.services.layer_postprocess import trim_layers, composite_preview
+from app.services.cancellation import (
+    CancelToken,
+    InferenceCancelled,
+    InferenceTimeout
 )
 
 
@@ -20,6 +41,27 @@ class ImageLayeredService:
         self.pipeline = None
         self.device = DEVICE
         self.output_dir = envs.OUTPUT_DIR or "outputs"
+        # 결과 파일 LRU 인덱스 (파일명 -> path, etag, stat)
+        self.file_index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.file_index_max_size = envs.FILE_INDEX_MAX_SIZE
+        self.compile_cache_dir = envs.COMPILE_CACHE_DIR
+        self.compiled = False
+        # 컴파일 캐시를 저장한 입력 형태 (layers, resolution)
+        self._compiled_shapes = set()
+        # 워밍업/첫 요청 지연 시간 (초)
+        self.metrics: Dict[str, Any] = {
+            "warmed_up": False,
+            "warmup_failed": False,
+            "warmup_cold_latency": None,
+            "warmup_warm_latency": None,
+            "first_request_latency": None,
+            "first_request_warmed": None,
+            "compile_cache_loaded": False,
+            "cancelled_requests": 0,
+            "timed_out_requests": 0,
+        }
+        # 추론은 별도 스레드에서 실행되므로 동시 실행 방지
+        self._inference_lock = asyncio.Lock()
         os.makedirs(self.output_dir, exist_ok=True)
 
     async def load_model(self):
@@ -85,11 +127,220 @@ class ImageLayeredService:
                 self.pipeline.load_lora_weights(LIGHTNING_LORA_PATH)
                 logger.info(f"Lightning LoRA loaded: {LIGHTNING_LORA_PATH}")
 
+            # 선택: torch.compile (실제 컴파일은 워밍업/첫 추론 시 수행)
+            if envs.ENABLE_TORCH_COMPILE:
+                self._enable_torch_compile()
+
             logger.info("Model loaded successfully!")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise
 
+    def _enable_torch_compile(self):
+        """transformer에 torch.compile 적용 및 디스크 컴파일 캐시 연결"""
+        os.makedirs(self.compile_cache_dir, exist_ok=True)
+        os.environ.setdefault(
+            "TORCHINDUCTOR_CACHE_DIR",
+            os.path.join(self.compile_cache_dir, "inductor"),
+        )
+        os.environ.setdefault(
+            "TRITON_CACHE_DIR", os.path.join(self.compile_cache_dir, "triton")
+        )
+
+        # 이전 프로세스가 저장한 컴파일 산출물 로드
+        artifact_path = os.path.join(
+            self.compile_cache_dir, COMPILE_ARTIFACT_FILENAME
+        )
+        if os.path.exists(artifact_path):
+            try:
+                with open(artifact_path, "rb") as f:
+                    torch.compiler.load_cache_artifacts(f.read())
+                self.metrics["compile_cache_loaded"] = True
+                logger.info(f"Compile cache loaded: {artifact_path}")
+            except Exception as e:
+                logger.warning(f"Failed to load compile cache: {e}")
+
+        self.pipeline.transformer = torch.compile(
+            self.pipeline.transformer, mode=TORCH_COMPILE_MODE
+        )
+        self.compiled = True
+        logger.info(f"torch.compile enabled (mode: {TORCH_COMPILE_MODE})")
+
+    def _save_compile_cache(self):
+        """컴파일 산출물을 디스크에 저장해 다음 프로세스 시작 시 재사용"""
+        try:
+            result = torch.compiler.save_cache_artifacts()
+            if result is None:
+                return
+            artifacts, _ = result
+            artifact_path = os.path.join(
+                self.compile_cache_dir, COMPILE_ARTIFACT_FILENAME
+            )
+            with open(artifact_path, "wb") as f:
+                f.write(artifacts)
+            logger.info(f"Compile cache saved: {artifact_path}")
+        except Exception as e:
+            logger.warning(f"Failed to save compile cache: {e}")
+
+    def _run_pipeline(
+        self,
+        image: Image.Image,
+        layers: int,
+        resolution: int,
+        num_inference_steps: int,
+        true_cfg_scale: float,
+        seed: int,
+        cancel_token: Optional[CancelToken] = None
+    ):
+        """
+        파이프라인 추론 실행 (디노이징/VAE 디코딩 구간을 스팬으로 기록)
+
+        cancel_token이 주어지면 스텝 경계마다 취소/제한 시간을 확인하고,
+        해당하면 남은 스텝과 디코딩을 건너뛰고 예외를 발생시킵니다.
+        """
+        step_end_ns = []
+
+        def on_step_end(pipeline, step, timestep, callback_kwargs):
+            step_end_ns.append(time.time_ns())
+            if cancel_token is not None:
+                cancel_token.check()
+            return callback_kwargs
+
+        with span(
+            "pipeline",
+            layers=layers,
+            resolution=resolution,
+            num_inference_steps=num_inference_steps,
+        ):
+            start_ns = time.time_ns()
+            with torch.inference_mode():
+                output = self.pipeline(
+                    image=image,
+                    layers=layers,
+                    resolution=resolution,
+                    num_inference_steps=num_inference_steps,
+                    true_cfg_scale=true_cfg_scale,
+                    generator=torch.Generator(device=self.device).manual_seed(seed),
+                    callback_on_step_end=on_step_end
+                )
+            end_ns = time.time_ns()
+
+            # 마지막 스텝 종료 시점을 기준으로 디노이징(입력 인코딩 포함)과 디코딩 구분
+            if step_end_ns:
+                record_span(
+                    "pipeline.denoise",
+                    start_ns,
+                    step_end_ns[-1],
+                    steps=len(step_end_ns),
+                )
+                record_span("pipeline.decode", step_end_ns[-1], end_ns)
+
+        return output
+
+    async def warmup(self):
+        """대표 입력으로 추론을 미리 실행해 첫 요청의 지연 시간 급증 방지"""
+        if self.pipeline is None:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+
+        image = Image.new(
+            "RGBA", (WARMUP_RESOLUTION, WARMUP_RESOLUTION), (128, 128, 128, 255)
+        )
+        latencies = []
+
+        try:
+            for run in range(max(1, envs.MODEL_WARMUP_RUNS)):
+                start = time.perf_counter()
+                self._run_pipeline(
+                    image=image,
+                    layers=WARMUP_LAYERS,
+                    resolution=WARMUP_RESOLUTION,
+                    num_inference_steps=WARMUP_NUM_INFERENCE_STEPS,
+                    true_cfg_scale=DEFAULT_TRUE_CFG_SCALE,
+                    seed=DEFAULT_SEED
+                )
+                latencies.append(time.perf_counter() - start)
+                logger.info(f"Warm-up run {run + 1}: {latencies[-1]:.2f}s")
+        except Exception:
+            # 워밍업 없이도 요청은 처리 가능하므로 준비 상태는 유지
+            self.metrics["warmup_failed"] = True
+            raise
+
+        self.metrics["warmup_cold_latency"] = latencies[0]
+        if len(latencies) > 1:
+            self.metrics["warmup_warm_latency"] = latencies[-1]
+        self.metrics["warmed_up"] = True
+
+        if self.compiled:
+            self._compiled_shapes.add((WARMUP_LAYERS, WARMUP_RESOLUTION))
+            self._save_compile_cache()
+
+        logger.info(
+            f"🔥 Warm-up finished - cold: {latencies[0]:.2f}s, "
+            f"warm: {latencies[-1]:.2f}s"
+        )
+
+    def _run_inference(self, **kwargs):
+        """추론 스레드 작업 (추론 후 새 입력 형태의 컴파일 캐시 저장)"""
+        output = self._run_pipeline(**kwargs)
+
+        # 새 입력 형태로 컴파일된 그래프도 다음 시작 시 재사용되도록 저장
+        shape = (kwargs["layers"], kwargs["resolution"])
+        if self.compiled and shape not in self._compiled_shapes:
+            self._compiled_shapes.add(shape)
+            self._save_compile_cache()
+
+        return output
+
+    async def _acquire_inference_lock(self, cancel_token: CancelToken):
+        """
+        추론 락 대기
+
+        하나의 acquire() 대기를 끝까지 유지해 도착 순서(FIFO)를 보장하고,
+        제한 시간 초과/연결 종료 시에만 대기를 포기합니다.
+        """
+        cancel_token.check()
+        acquire = asyncio.ensure_future(self._inference_lock.acquire())
+        try:
+            while not acquire.done():
+                giving_up = asyncio.ensure_future(cancel_token.wait_cancelled())
+                try:
+                    await asyncio.wait(
+                        {acquire, giving_up},
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    giving_up.cancel()
+                if not acquire.done():
+                    cancel_token.check()
+            cancel_token.check()
+        except BaseException:
+            self._abandon_lock_acquire(acquire)
+            raise
+
+    def _abandon_lock_acquire(self, acquire: asyncio.Future):
+        """락 대기 포기 (이미 획득한 경우 해제)"""
+        if not acquire.done():
+            acquire.cancel()
+        elif not acquire.cancelled() and acquire.exception() is None:
+            self._inference_lock.release()
+
+    def _release_inference_lock(self, inference: asyncio.Future):
+        """추론 스레드 종료 시 락 해제"""
+        self._inference_lock.release()
+        # 요청 태스크가 먼저 취소된 경우 예외 미확인 경고 방지
+        if not inference.cancelled():
+            inference.exception()
+
+    def is_ready(self) -> bool:
+        """요청 처리 준비 여부 (모델 로드 + 워밍업 완료 또는 실패 후 계속 진행)"""
+        if self.pipeline is None:
+            return False
+        return (
+            self.metrics["warmed_up"]
+            or self.metrics["warmup_failed"]
+            or not envs.ENABLE_MODEL_WARMUP
+        )
+
     async def decompose_image(
         self,
         image: Image.Image,
@@ -97,8 +348,10 @@ class ImageLayeredService:
         resolution: int = 640,
         num_inference_steps: int = 50,
         true_cfg_scale: float = 4.0,
-        seed: int = 42
-    ) -> Tuple[str, List[str], int]:
+        seed: int = 42,
+        trim: bool = False,
+        cancel_token: Optional[CancelToken] = None
+    ) -> Dict[str, Any]:
         """
         이미지를 여러 레이어로 분해
 
@@ -109,52 +362,210 @@ class ImageLayeredService:
             num_inference_steps: 추론 스텝 수 (LoRA 사용 시 8)
             true_cfg_scale: CFG 스케일
             seed: 랜덤 시드
+            trim: 레이어를 알파 영역으로 크롭하고 빈 레이어 제거 여부
+            cancel_token: 취소/제한 시간 토큰 (취소 시 결과를 저장하지 않음)
 
         Returns:
-            (result_id, layer_paths, count)
+            {id, layers, layer_meta, canvas, preview, count}
         """
         if self.pipeline is None:
             raise RuntimeError("Model not loaded. Call load_model() first.")
 
         try:
             # RGBA로 변환
-            image = image.convert("RGBA")
+            with span("image.convert"):
+                image = image.convert("RGBA")
 
-            # 추론
-            with torch.inference_mode():
-                output = self.pipeline(
-                    image=image,
-                    layers=layers,
-                    resolution=resolution,
-                    num_inference_steps=num_inference_steps,
-                    true_cfg_scale=true_cfg_scale,
-                    generator=torch.Generator(device=self.device).manual_seed(seed)
+            # 추론 스레드가 항상 다음 스텝에서 멈출 수 있도록 토큰 보장
+            if cancel_token is None:
+                cancel_token = CancelToken()
+
+            # 추론 (이벤트 루프가 연결 종료를 감지할 수 있도록 스레드에서 실행)
+            await self._acquire_inference_lock(cancel_token)
+            start = time.perf_counter()
+            inference = asyncio.ensure_future(asyncio.to_thread(
+                self._run_inference,
+                image=image,
+                layers=layers,
+                resolution=resolution,
+                num_inference_steps=num_inference_steps,
+                true_cfg_scale=true_cfg_scale,
+                seed=seed,
+                cancel_token=cancel_token
+            ))
+            inference.add_done_callback(self._release_inference_lock)
+            try:
+                output = await asyncio.shield(inference)
+            except asyncio.CancelledError:
+                # 요청 태스크가 취소되어도 스레드는 계속 실행되므로 다음 스텝에서
+                # 멈추도록 신호 (락은 스레드가 끝난 뒤 해제됨)
+                cancel_token.cancel("task cancelled")
+                self.metrics["cancelled_requests"] += 1
+                logger.warning(
+                    f"{request_log_prefix()}Image decomposition cancelled: "
+                    "task cancelled"
+                )
+                raise
+            latency = time.perf_counter() - start
+
+            # 디코딩 중 취소된 경우에도 저장 생략
+            cancel_token.check()
+
+            if self.metrics["first_request_latency"] is None:
+                warmed = self.metrics["warmed_up"]
+                self.metrics["first_request_latency"] = latency
+                self.metrics["first_request_warmed"] = warmed
+                logger.info(
+                    f"{request_log_prefix()}First request inference: "
+                    f"{latency:.2f}s "
+                    f"({'warm' if warmed else 'cold'})"
                 )
 
             # 결과 저장
             result_id = str(uuid.uuid4())[:8]
+            layer_images = output.images[0]
+            canvas = list(layer_images[0].size) if layer_images else [0, 0]
+            preview = None
+
+            if trim:
+                with span("layers.trim"):
+                    trimmed, kept_layers = trim_layers(
+                        layer_images, TRIM_ALPHA_THRESHOLD
+                    )
+                logger.info(
+                    f"{request_log_prefix()}Trimmed layers: "
+                    f"{len(layer_images)} -> {len(trimmed)}"
+                )
+            else:
+                trimmed = [
+                    (i, layer, (0, 0)) for i, layer in enumerate(layer_images)
+                ]
+
             paths = []
+            layer_meta = []
+
+            with span("layers.save", count=len(trimmed)):
+                for i, layer, offset in trimmed:
+                    filename = f"{result_id}_layer{i}.png"
+                    await self._save_image(layer, filename)
+                    paths.append(filename)
+                    layer_meta.append({
+                        "filename": filename,
+                        "index": i,
+                        "offset": list(offset),
+                        "size": list(layer.size),
+                    })
 
-            for i, layer in enumerate(output.images[0]):
-                filename = f"{result_id}_layer{i}.png"
-                file_path = os.path.join(self.output_dir, filename)
-                layer.save(file_path)
-                paths.append(filename)
-                logger.info(f"Saved layer {i} to {file_path}")
+            if trim and kept_layers:
+                preview = f"{result_id}_preview.png"
+                with span("preview.composite"):
+                    preview_image = composite_preview(
+                        kept_layers, tuple(canvas), PREVIEW_MAX_SIZE
+                    )
+                await self._save_image(preview_image, preview)
 
-            return result_id, paths, len(paths)
+            return {
+                "id": result_id,
+                "layers": paths,
+                "layer_meta": layer_meta,
+                "canvas": canvas,
+                "preview": preview,
+                "count": len(paths),
+            }
 
+        except InferenceTimeout as e:
+            self.metrics["timed_out_requests"] += 1
+            logger.warning(f"{request_log_prefix()}Image decomposition timed out: {e}")
+            raise
+        except InferenceCancelled as e:
+            self.metrics["cancelled_requests"] += 1
+            logger.warning(f"{request_log_prefix()}Image decomposition cancelled: {e}")
+            raise
         except Exception as e:
-            logger.error(f"Image decomposition failed: {e}")
+            logger.error(f"{request_log_prefix()}Image decomposition failed: {e}")
             raise
 
-    def get_file_path(self, filename: str) -> str:
-        """파일 경로 반환"""
+    async def _save_image(self, image: Image.Image, filename: str) -> str:
+        """결과 이미지를 PNG로 저장하고 파일 인덱스에 등록 (인코딩/기록은 스레드)"""
         file_path = os.path.join(self.output_dir, filename)
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {filename}")
+        with span("image.save", filename=filename):
+            entry = await asyncio.to_thread(
+                self._write_image, image, file_path
+            )
+        self._remember_file(filename, entry)
+        logger.info(f"{request_log_prefix()}Saved {filename} to {file_path}")
         return file_path
 
+    def _write_image(self, image: Image.Image, file_path: str) -> Dict[str, Any]:
+        """PNG 인코딩, 디스크 기록 후 인덱스 항목 생성"""
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        data = buffer.getvalue()
+
+        with open(file_path, "wb") as f:
+            f.write(data)
+
+        return self._build_file_entry(file_path, data)
+
+    def _read_file_entry(self, file_path: str) -> Dict[str, Any]:
+        """디스크의 결과 파일을 읽어 인덱스 항목 생성"""
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(
+                f"File not found: {os.path.basename(file_path)}"
+            )
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return self._build_file_entry(file_path, data)
+
+    @staticmethod
+    def _build_file_entry(file_path: str, data: bytes) -> Dict[str, Any]:
+        """파일 내용 해시(ETag)와 stat 정보로 인덱스 항목 생성"""
+        return {
+            "path": file_path,
+            "etag": f'"{hashlib.sha256(data).hexdigest()}"',
+            "stat": os.stat(file_path),
+        }
+
+    def _remember_file(self, filename: str, entry: Dict[str, Any]):
+        """인덱스에 항목 등록 (이벤트 루프에서만 호출)"""
+        self.file_index[filename] = entry
+        self.file_index.move_to_end(filename)
+        # 오래된 항목은 제거 (다시 요청되면 get_file_info에서 재등록)
+        while len(self.file_index) > self.file_index_max_size:
+            self.file_index.popitem(last=False)
+
+    def forget_file(self, filename: str):
+        """인덱스에서 파일 제거 (인덱싱 이후 삭제된 파일 등)"""
+        self.file_index.pop(filename, None)
+
+    async def get_file_info(self, filename: str) -> Dict[str, Any]:
+        """
+        결과 파일 정보 반환
+
+        작성 시점에 등록된 인덱스를 우선 사용하고, 인덱스에 없는 파일
+        (재시작 이전에 생성되었거나 LRU에서 밀려난 파일)은 스레드에서
+        디스크를 다시 읽어 등록합니다.
+
+        Returns:
+            {path, etag, stat}
+        """
+        entry = self.file_index.get(filename)
+        if entry is not None:
+            self.file_index.move_to_end(filename)
+            return entry
+
+        if os.path.basename(filename) != filename or filename.startswith("."):
+            raise FileNotFoundError(f"File not found: {filename}")
+
+        file_path = os.path.join(self.output_dir, filename)
+        entry = await asyncio.to_thread(self._read_file_entry, file_path)
+        self._remember_file(filename, entry)
+        return entry
+
+    async def get_file_path(self, filename: str) -> str:
+        """파일 경로 반환"""
+        return (await self.get_file_info(filename))["path"]
+
 
 # 싱글톤 인스턴스
 image_layered_service = ImageLayeredService()
@@ -0,0 +1,94 @@
+"""레이어 후처리 (알파 영역 크롭, 합성 미리보기)"""
+import numpy as np
+from PIL import Image
+from typing import List, Optional, Tuple
+
+
+def alpha_bbox(
+    layer: Image.Image, threshold: int = 0
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    알파 채널 기준 바운딩 박스 계산
+
+    Args:
+        layer: RGBA 레이어
+        threshold: 이 값보다 큰 알파만 내용으로 간주
+
+    Returns:
+        (left, top, right, bottom), 완전히 투명하면 None
+    """
+    alpha = layer.getchannel("A")
+    if threshold > 0:
+        alpha = alpha.point(lambda value: 255 if value > threshold else 0)
+    return alpha.getbbox()
+
+
+def trim_layers(
+    layers: List[Image.Image], threshold: int = 0
+) -> Tuple[List[Tuple[int, Image.Image, Tuple[int, int]]], List[Image.Image]]:
+    """
+    레이어를 알파 바운딩 박스로 크롭하고 빈 레이어는 제거
+
+    Args:
+        layers: 파이프라인 출력 레이어 목록
+        threshold: 알파 임계값
+
+    Returns:
+        (trimmed, kept)
+        - trimmed: [(원본 인덱스, 크롭된 이미지, (x, y) 오프셋)]
+        - kept: 남은 레이어의 전체 캔버스 이미지 (미리보기 합성용)
+    """
+    trimmed = []
+    kept = []
+
+    for index, layer in enumerate(layers):
+        if layer.mode != "RGBA":
+            layer = layer.convert("RGBA")
+        bbox = alpha_bbox(layer, threshold)
+        if bbox is None:
+            continue
+
+        # 크롭 영역만 복사되며 전체 캔버스 복사는 일어나지 않음
+        trimmed.append((index, layer.crop(bbox), bbox[:2]))
+        kept.append(layer)
+
+    return trimmed, kept
+
+
+def composite_preview(
+    layers: List[Image.Image], size: Tuple[int, int], max_size: int
+) -> Image.Image:
+    """
+    레이어를 순서대로(0번이 가장 아래) 알파 합성한 미리보기 생성
+
+    각 레이어를 먼저 미리보기 크기로 축소한 뒤 NumPy 버퍼로 변환하므로
+    전체 캔버스 크기의 배열은 만들지 않습니다.
+
+    Args:
+        layers: RGBA 레이어 목록
+        size: 캔버스 크기 (width, height)
+        max_size: 미리보기 긴 변의 최대 길이
+
+    Returns:
+        RGBA 미리보기 이미지
+    """
+    width, height = size
+    step = max(1, -(-max(width, height) // max_size))
+    out_h, out_w = -(-height // step), -(-width // step)
+
+    # 프리멀티플라이드 색상/알파 누적 버퍼
+    color = np.zeros((out_h, out_w, 3), dtype=np.float32)
+    alpha = np.zeros((out_h, out_w, 1), dtype=np.float32)
+
+    for layer in layers:
+        small = layer.reduce(step) if step > 1 else layer
+        rgba = np.asarray(small, dtype=np.float32)
+        src_alpha = rgba[..., 3:4] * (1.0 / 255.0)
+        color *= 1.0 - src_alpha
+        color += rgba[..., :3] * src_alpha
+        alpha *= 1.0 - src_alpha
+        alpha += src_alpha
+
+    rgb = np.divide(color, alpha, out=np.zeros_like(color), where=alpha > 0)
+    preview = np.concatenate([rgb, alpha * 255.0], axis=2)
+    return Image.fromarray(np.clip(preview, 0, 255).astype(np.uint8))
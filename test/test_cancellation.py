@@ -0,0 +1,300 @@
+"""추론 취소/제한 시간 전파 테스트 (느린 스텁 파이프라인 사용)"""
+import io
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app.config import envs
+from app.main import create_app
+from app.routers import image_layered
+from app.services.image_layered_service import ImageLayeredService
+from app.services.cancellation import (
+    CancelToken,
+    InferenceCancelled,
+    InferenceTimeout,
+)
+
+STEP_TIME = 0.05
+TOTAL_STEPS = 40
+
+
+class SlowPipeline:
+    """스텝마다 대기하고 callback_on_step_end를 호출하는 스텁 파이프라인"""
+
+    def __init__(self, step_time: float = STEP_TIME):
+        self.step_time = step_time
+        self.steps_run = 0
+        self.finished = False
+        # 실행 순서 확인용 입력 이미지 너비
+        self.calls = []
+
+    def __call__(
+        self,
+        image,
+        layers,
+        resolution,
+        num_inference_steps,
+        true_cfg_scale,
+        generator,
+        callback_on_step_end=None,
+    ):
+        self.calls.append(image.size[0])
+        for step in range(num_inference_steps):
+            time.sleep(self.step_time)
+            self.steps_run += 1
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, step, {})
+
+        self.finished = True
+        layer = Image.new("RGBA", (resolution, resolution), (255, 0, 0, 255))
+        return SimpleNamespace(images=[[layer] * layers])
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ImageLayeredService()
+    service.device = "cpu"
+    service.output_dir = str(tmp_path)
+    service.pipeline = SlowPipeline()
+    return service
+
+
+def _input_image(width: int = 64):
+    return Image.new("RGB", (width, 64), (0, 128, 255))
+
+
+def _decompose(service, cancel_token, width: int = 64, **kwargs):
+    kwargs.setdefault("num_inference_steps", TOTAL_STEPS)
+    return service.decompose_image(
+        image=_input_image(width),
+        layers=2,
+        resolution=64,
+        cancel_token=cancel_token,
+        **kwargs,
+    )
+
+
+def _assert_nothing_saved(service, tmp_path):
+    assert list(tmp_path.iterdir()) == []
+    assert len(service.file_index) == 0
+
+
+def test_deadline_stops_at_step_boundary(service, tmp_path):
+    cancel_token = CancelToken.from_timeout(STEP_TIME * 4)
+
+    with pytest.raises(InferenceTimeout):
+        asyncio.run(_decompose(service, cancel_token))
+
+    assert 0 < service.pipeline.steps_run < TOTAL_STEPS
+    assert not service.pipeline.finished
+    assert service.metrics["timed_out_requests"] == 1
+    assert service.metrics["cancelled_requests"] == 0
+    _assert_nothing_saved(service, tmp_path)
+
+
+def test_cancel_during_run(service, tmp_path):
+    cancel_token = CancelToken()
+
+    async def run():
+        task = asyncio.create_task(_decompose(service, cancel_token))
+        await asyncio.sleep(STEP_TIME * 4)
+        cancel_token.cancel("client disconnected")
+        await task
+
+    with pytest.raises(InferenceCancelled) as exc_info:
+        asyncio.run(run())
+
+    assert not isinstance(exc_info.value, InferenceTimeout)
+    assert 0 < service.pipeline.steps_run < TOTAL_STEPS
+    assert service.metrics["cancelled_requests"] == 1
+    assert service.metrics["timed_out_requests"] == 0
+    _assert_nothing_saved(service, tmp_path)
+
+
+def test_task_cancel_stops_thread_and_holds_lock(service, tmp_path):
+    async def run():
+        task = asyncio.create_task(_decompose(service, None))
+        await asyncio.sleep(STEP_TIME * 4)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # 스레드가 멈출 때까지 락을 유지해 다음 요청과 동시 실행되지 않음
+        assert service._inference_lock.locked()
+        while service._inference_lock.locked():
+            await asyncio.sleep(STEP_TIME)
+
+    asyncio.run(run())
+
+    assert service.pipeline.steps_run < TOTAL_STEPS
+    assert not service.pipeline.finished
+    assert service.metrics["cancelled_requests"] == 1
+    _assert_nothing_saved(service, tmp_path)
+
+
+def test_queued_request_gives_up_after_deadline(service, tmp_path):
+    async def run():
+        running_token = CancelToken()
+        running = asyncio.create_task(_decompose(service, running_token))
+        await asyncio.sleep(STEP_TIME)
+
+        started = time.monotonic()
+        with pytest.raises(InferenceTimeout):
+            await _decompose(service, CancelToken.from_timeout(STEP_TIME * 2))
+        waited = time.monotonic() - started
+
+        running_token.cancel("test finished")
+        with pytest.raises(InferenceCancelled):
+            await running
+        return waited
+
+    waited = asyncio.run(run())
+
+    # 앞선 추론이 끝날 때까지 기다리지 않고 제한 시간 직후 포기
+    assert waited < STEP_TIME * TOTAL_STEPS / 2
+    assert service.metrics["timed_out_requests"] == 1
+    _assert_nothing_saved(service, tmp_path)
+
+
+def test_queued_requests_run_in_arrival_order(service):
+    # 각 추론이 길어 대기 요청들이 오래 큐에 머무는 상황
+    async def run():
+        tasks = []
+        for width in range(1, 7):
+            tasks.append(asyncio.create_task(
+                _decompose(service, None, width=width, num_inference_steps=12)
+            ))
+            await asyncio.sleep(STEP_TIME * 3)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert service.pipeline.calls == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.fixture
+def client(service, monkeypatch):
+    monkeypatch.setattr(image_layered, "image_layered_service", service)
+    return TestClient(create_app())
+
+
+def _post_decompose(client, **params):
+    buffer = io.BytesIO()
+    _input_image().save(buffer, format="PNG")
+    return client.post(
+        "/api/image/decompose",
+        params={"layers": 2, "num_inference_steps": TOTAL_STEPS, **params},
+        files={"file": ("input.png", buffer.getvalue(), "image/png")},
+    )
+
+
+def test_router_returns_504_on_deadline(client, service, tmp_path):
+    response = _post_decompose(client, timeout=STEP_TIME * 4)
+
+    assert response.status_code == 504
+    assert service.metrics["timed_out_requests"] == 1
+    _assert_nothing_saved(service, tmp_path)
+
+
+def test_router_accepts_timeout_header(client, service, tmp_path):
+    buffer = io.BytesIO()
+    _input_image().save(buffer, format="PNG")
+    response = client.post(
+        "/api/image/decompose",
+        params={"layers": 2, "num_inference_steps": TOTAL_STEPS},
+        headers={"X-Request-Timeout": str(STEP_TIME * 4)},
+        files={"file": ("input.png", buffer.getvalue(), "image/png")},
+    )
+
+    assert response.status_code == 504
+    _assert_nothing_saved(service, tmp_path)
+
+
+def test_router_returns_499_on_disconnect(
+    client, service, tmp_path, monkeypatch
+):
+    async def disconnect_soon(request, cancel_token, interval=0.5):
+        await asyncio.sleep(STEP_TIME * 4)
+        cancel_token.cancel("client disconnected")
+
+    monkeypatch.setattr(image_layered, "_watch_disconnect", disconnect_soon)
+
+    response = _post_decompose(client)
+
+    assert response.status_code == 499
+    assert service.metrics["cancelled_requests"] == 1
+    _assert_nothing_saved(service, tmp_path)
+
+
+def _multipart_body(boundary: str) -> bytes:
+    buffer = io.BytesIO()
+    _input_image().save(buffer, format="PNG")
+    return (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="input.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + buffer.getvalue() + f"\r\n--{boundary}--\r\n".encode()
+
+
+@pytest.mark.parametrize("tracing", [False, True])
+def test_router_detects_real_client_disconnect(
+    service, tmp_path, monkeypatch, tracing
+):
+    monkeypatch.setattr(envs, "ENABLE_TRACING", tracing)
+    monkeypatch.setattr(envs, "TRACE_EXPORT_PATH", None)
+    monkeypatch.setattr(envs, "TRACE_COLLECTOR_URL", None)
+    monkeypatch.setattr(image_layered, "image_layered_service", service)
+    app = create_app()
+
+    boundary = "test-boundary"
+    body = _multipart_body(boundary)
+    disconnect_after = STEP_TIME * 4
+    state = {"body_sent": False, "disconnect_at": None}
+    messages = []
+
+    async def receive():
+        if not state["body_sent"]:
+            state["body_sent"] = True
+            state["disconnect_at"] = time.monotonic() + disconnect_after
+            return {"type": "http.request", "body": body, "more_body": False}
+        # 연결 종료 시각 전에는 대기 (is_disconnected()의 즉시 취소 대상)
+        remaining = state["disconnect_at"] - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/image/decompose",
+        "raw_path": b"/api/image/decompose",
+        "root_path": "",
+        "query_string": f"layers=2&num_inference_steps={TOTAL_STEPS}".encode(),
+        "headers": [
+            (
+                b"content-type",
+                f"multipart/form-data; boundary={boundary}".encode(),
+            ),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+    asyncio.run(app(scope, receive, send))
+
+    assert 0 < service.pipeline.steps_run < TOTAL_STEPS
+    assert not service.pipeline.finished
+    assert service.metrics["cancelled_requests"] == 1
+    _assert_nothing_saved(service, tmp_path)
+    assert messages[0]["status"] == 499